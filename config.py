@@ -12,7 +12,8 @@ class Config:
     
     # Perplexity API Settings
     PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
-    PERPLEXITY_TIMEOUT = 30  # seconds
+    PERPLEXITY_TIMEOUT = (5, 60)  # (connect, read) seconds
+    RESPONSE_CACHE_DIR = None  # directory for cached API responses; None disables
     
     # Available Perplexity Models
     MODELS = {
@@ -24,6 +25,8 @@ class Config:
     # Log Processing Settings
     MAX_LOG_SIZE = 10 * 1024 * 1024  # 10 MB
     MAX_LOGS_IN_CONTEXT = 100
+    MAX_PROMPT_TOKENS = 32000  # estimated at 4 characters a token
+    USE_RE2 = False  # parse with google-re2: linear-time worst case, but slower on typical logs
     
     # UI Settings
     THEME = "light"
@@ -1,196 +1,441 @@
+import io
 import re
 import json
-from datetime import datetime
-from typing import List, Dict, Any
-from collections import defaultdict
+import functools
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Iterable, Iterator, Union
+from collections import Counter, defaultdict
+from itertools import compress, count
+from operator import itemgetter, not_
+from config import Config
+
+if Config.USE_RE2:
+    # RE2 matches in linear time, building one automaton for the fused
+    # per-line alternation, but its per-call overhead makes typical logs
+    # parse several times slower, so it is opt-in. None of the patterns use
+    # lookarounds or backreferences, and only the API both modules share is
+    # used: google-re2 has no re flag constants and its patterns no .flags,
+    # so case-insensitivity is written inline as (?i:...) in the sources.
+    import re2 as re_engine
+else:
+    re_engine = re
+
+
+def _subgroup(match: re.Match, n: int) -> str:
+    """Return the n-th capture group inside the branch that produced a match"""
+    return match.group(match.lastindex + n)
+
+
+def _iter_lines(content: Union[str, bytes, Iterable[str]]) -> Iterator[str]:
+    """Yield lines one at a time, without their trailing newline"""
+    if isinstance(content, bytes):
+        # BytesIO shares the bytes object instead of copying it, and the
+        # wrapper decodes it chunk by chunk as lines are consumed; like the
+        # str path it splits on \n only and leaves any \r in the line
+        content = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', newline='\n')
+    if isinstance(content, str):
+        start = 0
+        while True:
+            end = content.find('\n', start)
+            if end < 0:
+                yield content[start:]
+                return
+            yield content[start:end]
+            start = end + 1
+    else:
+        for line in content:
+            yield line.rstrip('\n')
+
+
+def _memoized(method):
+    """Cache a summary method's result until the next parse_logs call"""
+    @functools.wraps(method)
+    def wrapper(self):
+        cache = self._summary_cache
+        if method.__name__ not in cache:
+            cache[method.__name__] = method(self)
+        return cache[method.__name__]
+    return wrapper
+
+
+def _to_epoch(timestamp: str) -> int:
+    """Convert an extracted timestamp to integer seconds, treating it as UTC"""
+    try:
+        return int(datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
+
 
 class LogProcessor:
     """Processes and analyzes log files"""
     
+    # Per-log fields kept column-wise in self.columns
+    COLUMNS = ('level', 'timestamp', 'ts_epoch', 'status_code', 'has_error', 'failed', 'endpoint', 'exception_type', 'identifiers')
+    # Distinct line templates remembered per parse; entries sharing a
+    # template share their parsed field objects
+    TEMPLATE_CACHE_SIZE = 50000
+    # Length of each entry's raw_short preview of its line
+    RAW_SHORT_LENGTH = 150
+    # Source of version numbers, shared by all instances
+    _versions = count()
+    
     def __init__(self):
+        # Renewed on every parse so callers can tell when cached views are
+        # stale; unique across instances, so a new processor (even one at a
+        # freed one's address) never matches an old cache entry
+        self.version = next(self._versions)
+        self._reset()
+        
+        # Common patterns for log parsing, compiled once so the per-line
+        # extractors don't go through the re module cache on every call.
+        # Case-insensitive ones carry a scoped (?i:...) group rather than a
+        # compile flag, so they keep it when fused into one alternation.
+        self.patterns = {
+            'timestamp': re_engine.compile(r'\d{4}-\d{2}-\d{2}[\sT]\d{2}:\d{2}:\d{2}'),
+            'log_level': re_engine.compile(r'(?i:\b(DEBUG|INFO|WARN|WARNING|ERROR|FATAL|CRITICAL)\b)'),
+            'api_endpoint': re_engine.compile(r'(GET|POST|PUT|DELETE|PATCH)\s+(/[^\s]*)'),
+            'status_code': re_engine.compile(r'\b([1-5]\d{2})\b'),
+            'user_id': re_engine.compile(r'(?i:user[_-]?id[=:\s]+([^\s,]+))'),
+            'username': re_engine.compile(r'(?i:username[=:\s]+([^\s,]+))'),
+            'email': re_engine.compile(r'(?i:\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b)'),
+            'trace_id': re_engine.compile(r'(?i:trace[_-]?id[=:\s]+([a-zA-Z0-9-]+))'),
+            'request_id': re_engine.compile(r'(?i:request[_-]?id[=:\s]+([a-zA-Z0-9-]+))'),
+            'session_id': re_engine.compile(r'(?i:session[_-]?id[=:\s]+([a-zA-Z0-9-]+))'),
+            'ip_address': re_engine.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b'),
+            'exception_type': re_engine.compile(r'\b(\w+Exception|\w+Error)'),
+        }
+        self._error_levels = frozenset(('ERROR', 'FATAL', 'CRITICAL'))
+        
+        # Fields pulled out of every line by a single scan, in priority order:
+        # when two patterns could claim the same text the earlier one wins
+        # (an IP address is never also read as a status code, for example)
+        self._scan_fields = [
+            'api_endpoint', 'user_id', 'username', 'trace_id',
+            'request_id', 'session_id', 'email', 'ip_address', 'log_level', 'status_code',
+            'exception_type',
+        ]
+        
+        # Literals, one of which must appear in the lowercased line for the
+        # field to match at all. Branches with none present are left out of
+        # the scan; each combination of branches is compiled once, on first use.
+        self._field_literals = {
+            'user_id': ('user',), 'username': ('user',), 'trace_id': ('trace',),
+            'request_id': ('request',), 'session_id': ('session',), 'email': ('@',),
+            'exception_type': ('error', 'exception'),
+        }
+        self._literals = tuple(sorted({literal for literals in self._field_literals.values() for literal in literals}))
+        
+        # Fields that identify a user or request. The main scan can't see
+        # them inside text another branch claimed (a user_id in an endpoint's
+        # query string, an email used as a username), so they're also taken
+        # from a scan of their own.
+        self._identifier_fields = (
+            'user_id', 'username', 'email', 'trace_id', 'request_id', 'session_id', 'ip_address',
+        )
+        # Branches whose text an identifier can start in, with the capture
+        # group to check (1 and 2 are the branch's own groups, 0 all of it)
+        # and what that text plus the character after it must contain for
+        # one to start there: a separator or @, an IP's digit and dot, a
+        # field name at the end (the rest of the identifier follows the
+        # claimed text), or a character that continues an email's local
+        # part past a trace/request/session id. Levels, status codes, IPs
+        # and exception names can't hold one.
+        names_at_end = r'(?:id|username|user|trace|request|session)[^a-z0-9]?\Z'
+        hides_identifier = re.compile(rf'[=:@]|\d\.|{names_at_end}|[._%+]\Z', re.IGNORECASE)
+        self._identifier_containers = {
+            'api_endpoint': (2, hides_identifier.search), 'user_id': (1, hides_identifier.search),
+            'username': (1, hides_identifier.search), 'trace_id': (1, hides_identifier.search),
+            'request_id': (1, hides_identifier.search), 'session_id': (1, hides_identifier.search),
+            # Every email has an @, so only what else it holds counts
+            'email': (0, re.compile(rf'[=:]|\d\.|{names_at_end}', re.IGNORECASE).search),
+        }
+        self._scanners = {}
+    
+    def _reset(self):
+        """Drop everything derived from a previous parse"""
         self.logs = []
         self.user_sessions = defaultdict(list)
         self.errors = []
         self.api_calls = []
+        self._identifier_index = defaultdict(list)
+        # Results of the summary methods below; the logs only change on
+        # re-parse, so chat turns reuse them (callers must not mutate them)
+        self._summary_cache = {}
+        # Struct-of-arrays view of self.logs: one list per field, aligned by
+        # row, so aggregations walk flat lists instead of per-log dicts
+        self.columns = {key: [] for key in self.COLUMNS}
+    
+    def _as_branch(self, key: str) -> str:
+        """Wrap a pattern as a named alternation branch"""
+        return f'(?P<{key}>{self.patterns[key].pattern})'
+    
+    def parse_logs(self, content: Union[str, bytes, Iterable[str]]) -> List[Dict[str, Any]]:
+        """Parse log file content (text, UTF-8 bytes or an iterable of lines) into structured data"""
+        parsed_logs = self._parse_lines(_iter_lines(content))
         
-        # Common patterns for log parsing
-        self.patterns = {
-            'timestamp': r'\d{4}-\d{2}-\d{2}[\sT]\d{2}:\d{2}:\d{2}',
-            'log_level': r'\b(DEBUG|INFO|WARN|WARNING|ERROR|FATAL|CRITICAL)\b',
-            'api_endpoint': r'(GET|POST|PUT|DELETE|PATCH)\s+(/[^\s]*)',
-            'status_code': r'\b(1\d{2}|2\d{2}|3\d{2}|4\d{2}|5\d{2})\b',
-            'user_id': r'user[_-]?id[=:\s]+([^\s,]+)',
-            'username': r'username[=:\s]+([^\s,]+)',
-            'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-            'trace_id': r'trace[_-]?id[=:\s]+([a-zA-Z0-9-]+)',
-            'request_id': r'request[_-]?id[=:\s]+([a-zA-Z0-9-]+)',
-            'session_id': r'session[_-]?id[=:\s]+([a-zA-Z0-9-]+)',
-            'ip_address': r'\b(?:\d{1,3}\.){3}\d{1,3}\b',
-            'exception': r'(Exception|Error|Traceback)',
-        }
+        # Bytes are decoded lazily, so a bad upload only fails part-way
+        # through the parse above; the previous file's state is dropped
+        # only once the new one has parsed
+        self._reset()
+        
+        # Columns and the error/API subsets are built with C-level map()
+        # and compress() rather than per-row appends in the hot loop
+        for key in self.COLUMNS:
+            self.columns[key] = list(map(itemgetter(key), parsed_logs))
+        self.errors = list(compress(parsed_logs, self.columns['has_error']))
+        self.api_calls = list(compress(parsed_logs, self.columns['endpoint']))
+        
+        # Group row numbers (indexes into self.logs) by user identifier, and
+        # by lowercased identifier for journey lookups; each row is listed
+        # once per value
+        for row, log_entry in enumerate(parsed_logs):
+            for identifier_type, identifier_value in log_entry['identifiers'].items():
+                if identifier_value:
+                    for rows in (self.user_sessions[identifier_value],
+                                 self._identifier_index[identifier_value.lower()]):
+                        if not rows or rows[-1] != row:
+                            rows.append(row)
+        
+        self.logs = parsed_logs
+        self.version = next(self._versions)
+        return parsed_logs
     
-    def parse_logs(self, content: str) -> List[Dict[str, Any]]:
-        """Parse log file content into structured data"""
-        lines = content.split('\n')
+    def _parse_lines(self, lines: Iterable[str]) -> List[Dict[str, Any]]:
+        """Parse raw lines into log entries; the per-line hot loop of parse_logs"""
         parsed_logs = []
+        append = parsed_logs.append
+        search_timestamp = self.patterns['timestamp'].search
+        parse_fields = self._parse_fields
+        template_cache = {}
+        cache_get = template_cache.get
+        cache_size = self.TEMPLATE_CACHE_SIZE
+        last_timestamp = last_epoch = None
+        short_length = self.RAW_SHORT_LENGTH
         
-        for idx, line in enumerate(lines):
+        for line_number, line in enumerate(lines, 1):
             if not line.strip():
                 continue
             
-            log_entry = {
-                'line_number': idx + 1,
-                'raw': line,
-                'timestamp': self._extract_timestamp(line),
-                'level': self._extract_log_level(line),
-                'api': self._extract_api_call(line),
-                'status_code': self._extract_status_code(line),
-                'identifiers': self._extract_identifiers(line),
-                'has_error': self._has_error(line),
-                'exception_type': self._extract_exception(line)
-            }
-            
-            parsed_logs.append(log_entry)
+            # Repeated messages usually differ only in their timestamp, so
+            # the rest of the line is parsed once per distinct template
+            timestamp = search_timestamp(line)
+            template = line[:timestamp.start()] + line[timestamp.end():] if timestamp else line
+            fields = cache_get(template)
+            if fields is None:
+                fields = parse_fields(template)
+                if len(template_cache) < cache_size:
+                    template_cache[template] = fields
             
-            # Track errors
-            if log_entry['has_error']:
-                self.errors.append(log_entry)
-            
-            # Track API calls
-            if log_entry['api']:
-                self.api_calls.append(log_entry)
+            # Timestamps are converted to epoch seconds once so journeys sort
+            # on ints; consecutive lines often share the same second
+            if timestamp:
+                timestamp = timestamp.group(0)
+                if timestamp != last_timestamp:
+                    last_timestamp, last_epoch = timestamp, _to_epoch(timestamp)
+                epoch = last_epoch
+            else:
+                timestamp = epoch = None
             
-            # Group by user identifiers
-            for identifier_type, identifier_value in log_entry['identifiers'].items():
-                if identifier_value:
-                    self.user_sessions[identifier_value].append(log_entry)
+            append({
+                'line_number': line_number,
+                'raw': line,
+                # Slicing a line no longer than this returns the line itself,
+                # so only long lines pay for a copy
+                'raw_short': line[:short_length],
+                'timestamp': timestamp,
+                'ts_epoch': epoch,
+                **fields
+            })
         
-        self.logs = parsed_logs
         return parsed_logs
     
-    def _extract_timestamp(self, line: str) -> str:
-        """Extract timestamp from log line"""
-        match = re.search(self.patterns['timestamp'], line)
-        return match.group(0) if match else None
-    
-    def _extract_log_level(self, line: str) -> str:
-        """Extract log level (INFO, ERROR, etc.)"""
-        match = re.search(self.patterns['log_level'], line, re.IGNORECASE)
-        return match.group(1).upper() if match else 'INFO'
+    def _parse_fields(self, text: str) -> Dict[str, Any]:
+        """Parse everything except the line number, raw text and timestamp"""
+        lowered = text.lower()
+        fields = self._scan_line(text, lowered)
+        level = fields.get('log_level')
+        api = fields.get('api_endpoint')
+        status_code = fields.get('status_code')
+        exception_type = fields.get('exception_type')
+        level_name = _subgroup(level, 1).upper() if level else 'INFO'
+        
+        # Error-level lines need no keyword scan
+        has_error = level_name in self._error_levels or self._has_error(lowered)
+        status_code = int(status_code.group(0)) if status_code else None
+        
+        return {
+            'level': level_name,
+            'api': {
+                'method': _subgroup(api, 1),
+                'endpoint': _subgroup(api, 2)
+            } if api else None,
+            'status_code': status_code,
+            'identifiers': self._extract_identifiers(fields),
+            'has_error': has_error,
+            # Either an error line or an HTTP error response
+            'failed': has_error or bool(status_code and status_code >= 400),
+            'exception_type': _subgroup(exception_type, 1) if exception_type else None,
+            'endpoint': f"{_subgroup(api, 1)} {_subgroup(api, 2)}" if api else None
+        }
     
-    def _extract_api_call(self, line: str) -> Dict[str, str]:
-        """Extract API method and endpoint"""
-        match = re.search(self.patterns['api_endpoint'], line)
-        if match:
-            return {
-                'method': match.group(1),
-                'endpoint': match.group(2)
-            }
-        return None
+    def _scanner(self, present: tuple, identifiers: bool = False, found: frozenset = frozenset()):
+        """Fused pattern with only the branches a line can possibly match, or
+        None if there are none
+        
+        present flags which of self._literals the lowercased line contains;
+        identifiers limits the pattern to identifier fields, and found
+        leaves out fields that have already matched.
+        """
+        cache_key = (present, identifiers, found)
+        if cache_key not in self._scanners:
+            literals = {literal for literal, hit in zip(self._literals, present) if hit}
+            keys = [key for key in (self._identifier_fields if identifiers else self._scan_fields)
+                    if key not in found and
+                    (key not in self._field_literals or literals.intersection(self._field_literals[key]))]
+            self._scanners[cache_key] = re_engine.compile(
+                '|'.join(self._as_branch(key) for key in keys)) if keys else None
+        return self._scanners[cache_key]
     
-    def _extract_status_code(self, line: str) -> int:
-        """Extract HTTP status code"""
-        match = re.search(self.patterns['status_code'], line)
-        if match:
-            code = int(match.group(1))
-            # Only return if it's a valid HTTP status code
-            if 100 <= code <= 599:
-                return code
-        return None
+    def _scan_line(self, line: str, lowered: str) -> Dict[str, re.Match]:
+        """Scan a line once, keeping the first match of each field
+        
+        Text claimed by one branch isn't scanned again, so an identifier
+        inside an endpoint's query string or another identifier's value
+        (user_id=42 in GET /users?user_id=42, an email used as a username)
+        would be lost. When a claimed span could hold one, identifiers are
+        rescanned so each gets the first match of its own pattern.
+        """
+        present = tuple(literal in lowered for literal in self._literals)
+        containers = self._identifier_containers
+        fields = {}
+        rescan = False
+        scanner = self._scanner(present)
+        if scanner is not None:
+            for match in scanner.finditer(line):
+                key = match.lastgroup
+                if key not in fields:
+                    fields[key] = match
+                container = containers.get(key) if not rescan else None
+                if container:
+                    group, hides_identifier = container
+                    start, end = match.span(match.lastindex + group)
+                    rescan = hides_identifier(line, start, end + 1) is not None
+        if not rescan:
+            return fields
+        
+        # The leftmost identifier match belongs to its field; searching again
+        # from its start without that field finds the next field's leftmost
+        # match, which may overlap it
+        for key in self._identifier_fields:
+            fields.pop(key, None)
+        found = frozenset()
+        position = 0
+        while True:
+            scanner = self._scanner(present, True, found)
+            match = scanner.search(line, position) if scanner is not None else None
+            if match is None:
+                break
+            fields[match.lastgroup] = match
+            found = found | {match.lastgroup}
+            position = match.start()
+        return fields
     
-    def _extract_identifiers(self, line: str) -> Dict[str, str]:
+    def _extract_identifiers(self, fields: Dict[str, re.Match]) -> Dict[str, str]:
         """Extract user identifiers (user_id, username, trace_id, etc.)"""
         identifiers = {}
         
-        for key in ['user_id', 'username', 'email', 'trace_id', 'request_id', 'session_id', 'ip_address']:
-            match = re.search(self.patterns[key], line, re.IGNORECASE)
+        for key in self._identifier_fields:
+            match = fields.get(key)
             if match:
                 if key in ['user_id', 'username', 'trace_id', 'request_id', 'session_id']:
-                    identifiers[key] = match.group(1)
+                    identifiers[key] = _subgroup(match, 1)
                 else:
                     identifiers[key] = match.group(0)
         
         return identifiers
     
-    def _has_error(self, line: str) -> bool:
-        """Check if line contains error or exception"""
-        return bool(re.search(self.patterns['exception'], line, re.IGNORECASE)) or \
-               'error' in line.lower() or 'exception' in line.lower()
-    
-    def _extract_exception(self, line: str) -> str:
-        """Extract exception type"""
-        # Look for common exception patterns
-        exception_pattern = r'(\w+Exception|\w+Error)'
-        match = re.search(exception_pattern, line)
-        return match.group(1) if match else None
+    def _has_error(self, lowered: str) -> bool:
+        """Check if a lowercased line contains error or exception"""
+        # C-level substring scans are far cheaper than a case-insensitive
+        # regex over the same literals
+        return 'error' in lowered or 'exception' in lowered or 'traceback' in lowered
     
     def get_user_journey(self, user_identifier: str) -> List[Dict[str, Any]]:
         """Get all logs for a specific user"""
-        # Search across all identifier types
-        user_logs = []
-        
-        for logs in self.user_sessions.values():
-            for log in logs:
-                for identifier_value in log['identifiers'].values():
-                    if identifier_value and user_identifier.lower() in str(identifier_value).lower():
-                        user_logs.append(log)
-                        break
+        return [self.logs[row] for row in self._journey_rows(user_identifier)]
+    
+    def _journey_rows(self, user_identifier: str) -> List[int]:
+        """Row numbers of a user's logs, in timestamp order"""
+        # Match against each distinct identifier value once rather than
+        # every identifier of every log; a set keeps each log only once
+        query = user_identifier.lower()
+        rows = set()
+        for identifier_value, value_rows in self._identifier_index.items():
+            if query in identifier_value:
+                rows.update(value_rows)
         
-        # Sort by timestamp
-        user_logs.sort(key=lambda x: x['timestamp'] or '')
-        return user_logs
+        # Sort by timestamp (stable, so same-second logs keep file order);
+        # logs without a timestamp come first
+        epochs = self.columns['ts_epoch']
+        ordered_rows = sorted(rows)
+        ordered_rows.sort(key=lambda row: float('-inf') if epochs[row] is None else epochs[row])
+        return ordered_rows
     
     def find_error_sequence(self, user_identifier: str) -> Dict[str, Any]:
         """Find where user started experiencing errors"""
-        user_logs = self.get_user_journey(user_identifier)
+        rows = self._journey_rows(user_identifier)
         
-        if not user_logs:
+        if not rows:
             return None
         
-        result = {
-            'total_requests': len(user_logs),
-            'successful_requests': [],
-            'failed_requests': [],
-            'first_error': None,
-            'last_successful_api': None,
-            'error_apis': []
-        }
-        
-        for log in user_logs:
-            if log['has_error'] or (log['status_code'] and log['status_code'] >= 400):
-                result['failed_requests'].append(log)
-                if not result['first_error']:
-                    result['first_error'] = log
-                if log['api']:
-                    result['error_apis'].append(log['api'])
-            else:
-                result['successful_requests'].append(log)
-                if log['api']:
-                    result['last_successful_api'] = log['api']
+        # Split the journey with the precomputed 'failed' column instead of
+        # re-testing error flags and status codes log by log
+        failed = list(map(self.columns['failed'].__getitem__, rows))
+        failed_requests = [self.logs[row] for row in compress(rows, failed)]
+        successful_requests = [self.logs[row] for row in compress(rows, map(not_, failed))]
+        successful_apis = [log['api'] for log in successful_requests if log['api']]
         
-        return result
+        return {
+            'total_requests': len(rows),
+            'successful_requests': successful_requests,
+            'failed_requests': failed_requests,
+            'first_error': failed_requests[0] if failed_requests else None,
+            'last_successful_api': successful_apis[-1] if successful_apis else None,
+            'error_apis': [log['api'] for log in failed_requests if log['api']]
+        }
     
+    @_memoized
     def get_statistics(self) -> Dict[str, Any]:
         """Get overall statistics"""
+        columns = self.columns
         stats = {
             'total_logs': len(self.logs),
-            'errors': len([l for l in self.logs if l['has_error']]),
-            'warnings': len([l for l in self.logs if l['level'] == 'WARN']),
+            'errors': sum(columns['has_error']),
+            'warnings': columns['level'].count('WARN'),
             'api_calls': len(self.api_calls),
             'unique_users': len(self.user_sessions),
-            'status_codes': defaultdict(int)
+            # Counter tallies the column in C; missing codes are dropped first
+            'status_codes': dict(sorted(Counter(filter(None, columns['status_code'])).items()))
         }
         
-        for log in self.logs:
-            if log['status_code']:
-                stats['status_codes'][log['status_code']] += 1
-        
         return stats
     
+    @_memoized
+    def feature_arrays(self) -> Dict[str, List[bool]]:
+        """Per-row flags for relevance scoring, aligned with self.logs:
+        has_error, has_identifiers and has_api"""
+        columns = self.columns
+        return {
+            'has_error': list(map(bool, columns['has_error'])),
+            'has_identifiers': list(map(bool, columns['identifiers'])),
+            'has_api': list(map(bool, columns['endpoint'])),
+        }
+    
     def get_all_users(self) -> List[str]:
         """Get list of all unique user identifiers"""
         return list(self.user_sessions.keys())
     
+    @_memoized
     def get_api_summary(self) -> Dict[str, Any]:
         """Get summary of all API calls"""
         api_stats = defaultdict(lambda: {
@@ -200,50 +445,44 @@ class LogProcessor:
             'errors': []
         })
         
-        for log in self.api_calls:
-            if log['api']:
-                endpoint = f"{log['api']['method']} {log['api']['endpoint']}"
-                api_stats[endpoint]['total_calls'] += 1
-                
-                if log['status_code'] and log['status_code'] < 400:
-                    api_stats[endpoint]['successful'] += 1
-                elif log['has_error'] or (log['status_code'] and log['status_code'] >= 400):
-                    api_stats[endpoint]['failed'] += 1
-                    if log['exception_type']:
-                        api_stats[endpoint]['errors'].append(log['exception_type'])
+        columns = self.columns
+        rows = zip(columns['endpoint'], columns['status_code'], columns['failed'], columns['exception_type'])
+        
+        for endpoint, status_code, failed, exception_type in rows:
+            if not endpoint:
+                continue
+            api_stats[endpoint]['total_calls'] += 1
+            
+            if status_code and status_code < 400:
+                api_stats[endpoint]['successful'] += 1
+            elif failed:
+                api_stats[endpoint]['failed'] += 1
+                if exception_type:
+                    api_stats[endpoint]['errors'].append(exception_type)
         
         return dict(api_stats)
     
+    @_memoized
     def find_common_patterns(self) -> Dict[str, Any]:
         """Find common error patterns"""
-        error_patterns = {
-            'most_common_exceptions': defaultdict(int),
-            'most_failed_apis': defaultdict(int),
-            'error_by_status_code': defaultdict(int),
-            'affected_users': set()
-        }
+        columns = self.columns
+        errors = columns['has_error']
         
-        for log in self.errors:
-            if log['exception_type']:
-                error_patterns['most_common_exceptions'][log['exception_type']] += 1
-            
-            if log['api']:
-                endpoint = f"{log['api']['method']} {log['api']['endpoint']}"
-                error_patterns['most_failed_apis'][endpoint] += 1
-            
-            if log['status_code']:
-                error_patterns['error_by_status_code'][log['status_code']] += 1
-            
-            for identifier_value in log['identifiers'].values():
-                if identifier_value:
-                    error_patterns['affected_users'].add(identifier_value)
+        def error_values(key):
+            # Non-empty values of a column on error rows
+            return filter(None, compress(columns[key], errors))
         
-        # Convert to regular dict for JSON serialization
+        affected_users = set()
+        for identifiers in compress(columns['identifiers'], errors):
+            affected_users.update(filter(None, identifiers.values()))
+        
+        # Counter tallies each column in C in a single call; convert to
+        # regular dicts for JSON serialization
         return {
-            'most_common_exceptions': dict(error_patterns['most_common_exceptions']),
-            'most_failed_apis': dict(error_patterns['most_failed_apis']),
-            'error_by_status_code': dict(error_patterns['error_by_status_code']),
-            'affected_users': list(error_patterns['affected_users'])
+            'most_common_exceptions': dict(Counter(error_values('exception_type'))),
+            'most_failed_apis': dict(Counter(error_values('endpoint'))),
+            'error_by_status_code': dict(Counter(error_values('status_code'))),
+            'affected_users': list(affected_users)
         }
     
     def prepare_context_for_ai(self, max_logs: int = 100) -> str:
@@ -271,9 +510,6 @@ ERROR PATTERNS:
 RECENT LOGS (last {min(max_logs, len(self.logs))} entries):
 """
         
-        # Add sample of recent logs
+        # Add sample of recent logs, joined in one pass
         recent_logs = self.logs[-max_logs:] if len(self.logs) > max_logs else self.logs
-        for log in recent_logs:
-            context += f"\n[{log['level']}] {log['raw'][:200]}"
-        
-        return context
+        return context + ''.join(f"\n[{log['level']}] {log['raw'][:200]}" for log in recent_logs)
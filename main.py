@@ -77,6 +77,8 @@ if 'log_processor' not in st.session_state:
     st.session_state.log_processor = None
 if 'agent' not in st.session_state:
     st.session_state.agent = None
+if 'log_file_id' not in st.session_state:
+    st.session_state.log_file_id = None
 
 # Header
 st.markdown('<div class="main-header">🔍 AI Log Analyzer</div>', unsafe_allow_html=True)
@@ -96,7 +98,7 @@ with st.sidebar:
     if api_key:
         st.session_state.api_key = api_key
         if not st.session_state.agent:
-            st.session_state.agent = PerplexityAgent(api_key)
+            st.session_state.agent = PerplexityAgent(api_key, cache_dir=Config.RESPONSE_CACHE_DIR)
     
     st.divider()
     
@@ -136,14 +138,17 @@ with col1:
     
     if uploaded_file:
         try:
-            # Read file content
-            content = uploaded_file.read().decode('utf-8')
-            
-            # Process logs
-            if not st.session_state.log_processor:
-                st.session_state.log_processor = LogProcessor()
-            
-            st.session_state.log_data = st.session_state.log_processor.parse_logs(content)
+            # Parse each upload once; every chat message triggers a rerun
+            # and would otherwise re-parse the same file
+            if st.session_state.log_data is None or st.session_state.log_file_id != uploaded_file.file_id:
+                # Process logs; getvalue() hands over the upload's bytes
+                # without copying them or moving its read position, and
+                # they are decoded line by line while parsing
+                if not st.session_state.log_processor:
+                    st.session_state.log_processor = LogProcessor()
+                
+                st.session_state.log_data = st.session_state.log_processor.parse_logs(uploaded_file.getvalue())
+                st.session_state.log_file_id = uploaded_file.file_id
             
             st.success(f"✅ Processed {len(st.session_state.log_data)} log entries")
             
@@ -156,6 +161,9 @@ with col1:
                 st.metric("Warnings", stats.get('warnings', 0))
                 
         except Exception as e:
+            # Don't keep analysing a previous file as if it were this upload
+            st.session_state.log_data = None
+            st.session_state.log_file_id = None
             st.error(f"Error processing file: {str(e)}")
     
     st.markdown('</div>', unsafe_allow_html=True)
@@ -182,22 +190,21 @@ with col2:
             # Add user message
             st.session_state.messages.append({"role": "user", "content": prompt})
             
-            # Process with agent
-            with st.spinner("🔍 Analyzing logs..."):
-                try:
-                    response = st.session_state.agent.analyze_logs(
-                        prompt,
-                        st.session_state.log_data,
-                        st.session_state.log_processor,
-                        analysis_depth,
-                        auto_detect_user
-                    )
-                    
-                    # Add assistant response
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
+            # Process with agent, showing the answer as it streams in
+            try:
+                response = st.write_stream(st.session_state.agent.analyze_logs_stream(
+                    prompt,
+                    st.session_state.log_data,
+                    st.session_state.log_processor,
+                    analysis_depth,
+                    auto_detect_user
+                ))
+                
+                # Add assistant response
+                st.session_state.messages.append({"role": "assistant", "content": response})
+                
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
             
             st.rerun()
     
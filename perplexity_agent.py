@@ -1,17 +1,102 @@
+import os
+import re
+import heapq
+import hashlib
+import tempfile
 import requests
 import json
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Any, Iterator, Union
+from config import Config
+
+try:
+    # Several times faster than the json module on the large prompt and the
+    # streamed response chunks; used when installed
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """Compact UTF-8 JSON, the same bytes with or without orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, sort_keys=sort_keys, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _json_loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON text or UTF-8 bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Phrasings like "user john", "username: john" or "for john"
+_USER_PATTERNS = tuple(re.compile(pattern) for pattern in (
+    r'user\s+(\w+)',
+    r'username[:\s]+(\w+)',
+    r'for\s+(\w+)',
+))
+
+# Query words that make logs carrying user identifiers more relevant
+_USER_QUERY_KEYWORDS = ('user', 'username', 'journey', 'track')
+
+# Longest answer requested from the model, in tokens, by analysis depth
+_MAX_TOKENS_BY_DEPTH = {
+    "Quick": 512,
+    "Standard": 1200,
+    "Deep": 2000
+}
+
+# Relevant log entries included in the prompt, by analysis depth
+_MAX_LOGS_BY_DEPTH = {
+    "Quick": 20,
+    "Standard": 50,
+    "Deep": 100
+}
 
 class PerplexityAgent:
     """AI Agent using Perplexity API for log analysis"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache_dir: str = None):
         self.api_key = api_key
+        # Directory for cached responses to identical requests; None disables it
+        self.cache_dir = cache_dir
         self.base_url = "https://api.perplexity.ai/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip"
         }
+        # One session for all calls, so follow-up questions reuse the open
+        # TLS connection instead of handshaking again. Rate limits and
+        # transient server errors are retried with exponential backoff,
+        # waiting as long as Retry-After asks; once retries run out the last
+        # response is returned and reported as an API error as before.
+        # Read and other mid-request failures aren't retried: the request
+        # may already be generating, and each resend is another billed call.
+        # A failed connect never reached the server, so it can be retried.
+        retry = Retry(
+            total=4,
+            connect=2,
+            read=0,
+            other=0,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self._session = requests.Session()
+        self._session.headers.update(self.headers)
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+        # API calls analyze_logs_batch keeps in flight at once
+        self.max_connections = 4
+        # Values derived from the last processor seen (the user index and
+        # the rendered summary sections), keyed by its version, which is
+        # unique across processors and renewed on every parse
+        self._summary_cache = (None, {})
         
         # System prompt for log analysis
         self.system_prompt = """You are an expert log analysis assistant. Your role is to:
@@ -47,6 +132,78 @@ Always structure your responses with:
     ) -> str:
         """Analyze logs based on user query using Perplexity API"""
         
+        messages, model, max_tokens = self._build_request(
+            user_query, log_data, log_processor, analysis_depth, auto_detect_user
+        )
+        
+        # Call Perplexity API
+        try:
+            response = self._call_perplexity_api(messages, model, max_tokens)
+            return response
+        except Exception as e:
+            return f"Error analyzing logs: {str(e)}"
+    
+    def analyze_logs_stream(
+        self, 
+        user_query: str, 
+        log_data: List[Dict[str, Any]], 
+        log_processor,
+        analysis_depth: str = "Standard",
+        auto_detect_user: bool = True
+    ) -> Iterator[str]:
+        """Like analyze_logs, but yields the answer piece by piece as it arrives"""
+        
+        messages, model, max_tokens = self._build_request(
+            user_query, log_data, log_processor, analysis_depth, auto_detect_user
+        )
+        
+        try:
+            yield from self._call_perplexity_api_stream(messages, model, max_tokens)
+        except Exception as e:
+            yield f"Error analyzing logs: {str(e)}"
+    
+    def analyze_logs_batch(
+        self, 
+        user_queries: List[str], 
+        log_data: List[Dict[str, Any]], 
+        log_processor,
+        analysis_depth: str = "Standard",
+        auto_detect_user: bool = True
+    ) -> List[str]:
+        """Analyze several queries at once; returns the answers in query order
+        
+        Up to max_connections API calls run concurrently, and a new one starts
+        as soon as any finishes, so the batch takes about as long as its
+        slowest few calls rather than all of them back to back.
+        """
+        
+        # Contexts are built here, one after another; only the network calls
+        # run on the worker threads
+        batch = [
+            self._build_request(query, log_data, log_processor, analysis_depth, auto_detect_user)
+            for query in user_queries
+        ]
+        
+        def call(request):
+            messages, model, max_tokens = request
+            try:
+                return self._call_perplexity_api(messages, model, max_tokens)
+            except Exception as e:
+                return f"Error analyzing logs: {str(e)}"
+        
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            return list(executor.map(call, batch))
+    
+    def _build_request(
+        self,
+        user_query: str,
+        log_data: List[Dict[str, Any]],
+        log_processor,
+        analysis_depth: str,
+        auto_detect_user: bool
+    ) -> tuple:
+        """Messages, model and answer token limit for an analysis request"""
+        
         # Prepare context from logs
         context = self._prepare_analysis_context(
             user_query, 
@@ -65,12 +222,7 @@ Always structure your responses with:
         # Determine model based on analysis depth
         model = self._get_model_for_depth(analysis_depth)
         
-        # Call Perplexity API
-        try:
-            response = self._call_perplexity_api(messages, model)
-            return response
-        except Exception as e:
-            return f"Error analyzing logs: {str(e)}"
+        return messages, model, _MAX_TOKENS_BY_DEPTH.get(analysis_depth, 2000)
     
     def _prepare_analysis_context(
         self,
@@ -82,19 +234,11 @@ Always structure your responses with:
     ) -> str:
         """Prepare comprehensive context for AI analysis"""
         
-        context = f"USER QUERY: {user_query}\n\n"
+        # Sections are collected in a list and joined once at the end
+        parts = [f"USER QUERY: {user_query}\n\n"]
         
         # Get statistics
-        stats = log_processor.get_statistics()
-        context += f"""OVERALL STATISTICS:
-- Total Logs: {stats['total_logs']}
-- Errors Found: {stats['errors']}
-- Warnings: {stats['warnings']}
-- API Calls: {stats['api_calls']}
-- Unique Users: {stats['unique_users']}
-- Status Code Distribution: {dict(stats['status_codes'])}
-
-"""
+        parts.append(self._cached(log_processor, 'statistics', lambda: self._statistics_section(log_processor)))
         
         # Extract user identifier from query if present
         user_identifier = None
@@ -103,11 +247,11 @@ Always structure your responses with:
         
         # If specific user mentioned, provide their journey
         if user_identifier:
-            context += f"\nUSER JOURNEY ANALYSIS FOR: {user_identifier}\n"
+            parts.append(f"\nUSER JOURNEY ANALYSIS FOR: {user_identifier}\n")
             user_journey = log_processor.get_user_journey(user_identifier)
             error_sequence = log_processor.find_error_sequence(user_identifier)
             
-            context += f"""
+            parts.append(f"""
 Journey Summary:
 - Total Requests: {error_sequence['total_requests']}
 - Successful: {len(error_sequence['successful_requests'])}
@@ -116,161 +260,277 @@ Journey Summary:
 - Last Successful API: {error_sequence['last_successful_api'] if error_sequence['last_successful_api'] else 'None'}
 
 Detailed Journey:
-"""
-            for log in user_journey:
-                context += f"Line {log['line_number']}: [{log['level']}] {log['raw'][:150]}\n"
+""")
+            parts.append("".join(
+                f"Line {log['line_number']}: [{log['level']}] {log['raw_short']}\n" for log in user_journey
+            ))
             
-            context += "\n"
+            parts.append("\n")
         
         # Add API summary
-        api_summary = log_processor.get_api_summary()
-        context += f"\nAPI ENDPOINT SUMMARY:\n"
-        for endpoint, stats in api_summary.items():
-            context += f"- {endpoint}: {stats['total_calls']} calls, {stats['successful']} success, {stats['failed']} failed\n"
+        parts.append(self._cached(log_processor, 'api_summary', lambda: self._api_summary_section(log_processor)))
         
         # Add error patterns
+        parts.append(self._cached(log_processor, 'patterns', lambda: self._patterns_section(log_processor)))
+        
+        parts.append(None)  # relevant log entries, filled in below
+        parts.append("\n\nBased on this log data, please provide a detailed analysis addressing the user's query.")
+        
+        # Add relevant log samples based on query, halving how many are
+        # included while the prompt is over budget (about 4 characters a token)
+        other_length = sum(len(part) for part in parts if part)
+        selected_logs = self._get_relevant_logs(user_query, log_data, log_processor, analysis_depth)
+        relevant = self._format_relevant_logs(selected_logs)
+        while (other_length + len(relevant)) // 4 > Config.MAX_PROMPT_TOKENS and len(selected_logs) > 1:
+            selected_logs = selected_logs[:len(selected_logs) // 2]
+            relevant = self._format_relevant_logs(selected_logs)
+        parts[-2] = relevant
+        
+        return "".join(parts)
+    
+    def _cached(self, log_processor, name: str, build):
+        """Value of build() for the processor's current logs, built once per parse"""
+        key = log_processor.version
+        cached_key, cache = self._summary_cache
+        if cached_key != key:
+            cache = {}
+            self._summary_cache = (key, cache)
+        if name not in cache:
+            cache[name] = build()
+        return cache[name]
+    
+    def _statistics_section(self, log_processor) -> str:
+        """Context section with overall log statistics"""
+        stats = log_processor.get_statistics()
+        return f"""OVERALL STATISTICS:
+- Total Logs: {stats['total_logs']}
+- Errors Found: {stats['errors']}
+- Warnings: {stats['warnings']}
+- API Calls: {stats['api_calls']}
+- Unique Users: {stats['unique_users']}
+- Status Code Distribution: {stats['status_codes']}
+
+"""
+    
+    def _api_summary_section(self, log_processor) -> str:
+        """Context section with per-endpoint call counts"""
+        api_summary = log_processor.get_api_summary()
+        return "\nAPI ENDPOINT SUMMARY:\n" + "".join(
+            f"- {endpoint}: {stats['total_calls']} calls, {stats['successful']} success, {stats['failed']} failed\n"
+            for endpoint, stats in api_summary.items()
+        )
+    
+    def _patterns_section(self, log_processor) -> str:
+        """Context section with the most common error patterns"""
         patterns = log_processor.find_common_patterns()
-        context += f"\nERROR PATTERNS:\n"
-        context += f"Most Common Exceptions: {patterns['most_common_exceptions']}\n"
-        context += f"Most Failed APIs: {patterns['most_failed_apis']}\n"
-        context += f"Affected Users: {len(patterns['affected_users'])} users\n\n"
-        
-        # Add relevant log samples based on query
-        context += self._get_relevant_logs(user_query, log_data, analysis_depth)
-        
-        context += "\n\nBased on this log data, please provide a detailed analysis addressing the user's query."
-        
-        return context
+        return (
+            "\nERROR PATTERNS:\n"
+            f"Most Common Exceptions: {patterns['most_common_exceptions']}\n"
+            f"Most Failed APIs: {patterns['most_failed_apis']}\n"
+            f"Affected Users: {len(patterns['affected_users'])} users\n\n"
+        )
     
     def _extract_user_from_query(self, query: str, log_processor) -> str:
         """Extract user identifier from query"""
         query_lower = query.lower()
-        
-        # Check if query mentions specific user
-        for user in log_processor.get_all_users():
-            if user.lower() in query_lower:
-                return user
+        users, lengths = self._cached(log_processor, 'user_index', lambda: self._user_index(log_processor))
+        
+        # Check if query mentions specific user: look up every slice of the
+        # query that is as long as some user, rather than searching the query
+        # once per user; the user seen first in the logs wins
+        mentioned = None
+        for length in lengths:
+            if length > len(query_lower):
+                break
+            for start in range(len(query_lower) - length + 1):
+                found = users.get(query_lower[start:start + length])
+                if found and (mentioned is None or found < mentioned):
+                    mentioned = found
+        if mentioned:
+            return mentioned[1]
         
         # Look for patterns like "user john" or "username: john"
-        import re
-        patterns = [
-            r'user\s+(\w+)',
-            r'username[:\s]+(\w+)',
-            r'for\s+(\w+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, query_lower)
+        for pattern in _USER_PATTERNS:
+            match = pattern.search(query_lower)
             if match:
                 potential_user = match.group(1)
                 # Check if this user exists in logs
-                for user in log_processor.get_all_users():
-                    if potential_user in user.lower():
+                for user_lower, (_, user) in users.items():
+                    if potential_user in user_lower:
                         return user
         
         return None
     
-    def _get_relevant_logs(self, query: str, log_data: List[Dict[str, Any]], depth: str) -> str:
-        """Get most relevant log entries based on query"""
+    def _user_index(self, log_processor) -> tuple:
+        """Map of lowercased user identifier to (position, first user spelled
+        that way), in log order, and the sorted distinct key lengths"""
+        users = {}
+        for user in log_processor.get_all_users():
+            users.setdefault(user.lower(), (len(users), user))
+        return users, sorted({len(user_lower) for user_lower in users})
+    
+    def _get_relevant_logs(self, query: str, log_data: List[Dict[str, Any]], log_processor, depth: str) -> List[Dict[str, Any]]:
+        """Get most relevant log entries based on query, most relevant first"""
         
         # Determine how many logs to include
-        max_logs = {
-            "Quick": 20,
-            "Standard": 50,
-            "Deep": 100
-        }.get(depth, 50)
+        max_logs = _MAX_LOGS_BY_DEPTH.get(depth, 50)
         
         query_lower = query.lower()
-        relevant_logs = []
-        
-        # Prioritize logs based on query keywords
-        for log in log_data:
-            relevance_score = 0
-            
-            # High priority for errors if query mentions errors
-            if 'error' in query_lower and log['has_error']:
-                relevance_score += 10
-            
-            # High priority for specific user if mentioned
-            if any(keyword in query_lower for keyword in ['user', 'username', 'journey', 'track']):
-                if log['identifiers']:
-                    relevance_score += 5
-            
-            # Priority for API calls if query mentions APIs
-            if 'api' in query_lower and log['api']:
-                relevance_score += 5
-            
-            # Always include errors
-            if log['has_error']:
-                relevance_score += 3
-            
-            relevant_logs.append((relevance_score, log))
         
-        # Sort by relevance and take top N
-        relevant_logs.sort(key=lambda x: x[0], reverse=True)
-        selected_logs = [log for _, log in relevant_logs[:max_logs]]
+        # Prioritize logs based on query keywords. What the query asks for
+        # is the same for every log, so it's folded into per-feature weights:
+        # errors always count 3, plus 10 if the query mentions errors; logs
+        # with identifiers count 5 if it's about users; API calls count 5 if
+        # it mentions APIs
+        error_weight = 3 + (10 if 'error' in query_lower else 0)
+        identifier_weight = 5 if any(keyword in query_lower for keyword in _USER_QUERY_KEYWORDS) else 0
+        api_weight = 5 if 'api' in query_lower else 0
+        
+        # The processor's precomputed flags line up row for row with its own
+        # logs only; any other list (filtered, or left from an earlier parse)
+        # is flagged from its entries
+        if log_data is log_processor.logs:
+            features = log_processor.feature_arrays()
+            flags = zip(features['has_error'], features['has_identifiers'], features['has_api'])
+        else:
+            flags = ((bool(log['has_error']), bool(log['identifiers']), bool(log['api'])) for log in log_data)
+        scores = [
+            error_weight * has_error + identifier_weight * has_identifiers + api_weight * has_api
+            for has_error, has_identifiers, has_api in flags
+        ]
         
-        # Format logs
-        context = "RELEVANT LOG ENTRIES:\n"
+        # Take the top N by relevance (ties keep log order) with a bounded
+        # heap rather than sorting every log
+        rows = heapq.nlargest(max_logs, range(len(scores)), key=scores.__getitem__)
+        return [log_data[row] for row in rows]
+    
+    def _format_relevant_logs(self, selected_logs: List[Dict[str, Any]]) -> str:
+        """Context section listing the given log entries in full"""
+        parts = ["RELEVANT LOG ENTRIES:\n"]
         for log in selected_logs:
-            context += f"\nLine {log['line_number']} [{log['level']}]"
+            parts.append(f"\nLine {log['line_number']} [{log['level']}]")
             if log['timestamp']:
-                context += f" {log['timestamp']}"
+                parts.append(f" {log['timestamp']}")
             if log['api']:
-                context += f" {log['api']['method']} {log['api']['endpoint']}"
+                parts.extend((" ", log['api']['method'], " ", log['api']['endpoint']))
             if log['status_code']:
-                context += f" [{log['status_code']}]"
-            context += f"\n{log['raw']}\n"
+                parts.append(f" [{log['status_code']}]")
+            parts.extend(("\n", log['raw'], "\n"))
         
-        return context
+        return "".join(parts)
     
     def _get_model_for_depth(self, depth: str) -> str:
         """Get appropriate Perplexity model based on analysis depth"""
-        models = {
-        "quick": "sonar",
-        "standard": "sonar",
-        "deep": "sonar"
-        }
-        return models.get(depth, "sonar")
+        # Config.MODELS is keyed by lowercase depth; the UI passes "Standard" etc.
+        return Config.get_model(depth)
     
-    def _call_perplexity_api(self, messages: List[Dict[str, str]], model: str) -> str:
+    def _call_perplexity_api(self, messages: List[Dict[str, str]], model: str, max_tokens: int = 2000) -> str:
         """Make API call to Perplexity"""
+        return "".join(self._call_perplexity_api_stream(messages, model, max_tokens))
+    
+    def _call_perplexity_api_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int = 2000
+    ) -> Iterator[str]:
+        """Make a streaming API call to Perplexity, yielding content as it's generated"""
         
         payload = {
             "model": model,
             "messages": messages,
             "temperature": 0.2,
-            "max_tokens": 2000,
-            "stream": False
+            "max_tokens": max_tokens,
+            "stream": True
         }
         
-        response = requests.post(
-            self.base_url,
-            headers=self.headers,
-            json=payload,
-            timeout=30
-        )
+        # Serialized once: the same bytes are the request body and, sorted
+        # as they are, the cache key
+        body = _json_dumps(payload, sort_keys=True)
         
-        if response.status_code == 200:
-            result = response.json()
-            return result['choices'][0]['message']['content']
-        else:
-            raise Exception(f"API Error: {response.status_code} - {response.text}")
+        cache_path = self._cache_path(body)
+        if cache_path:
+            cached = self._read_cache(cache_path)
+            if cached is not None:
+                yield cached
+                return
+        
+        pieces = []
+        with self._session.post(
+            self.base_url,
+            data=body,
+            timeout=Config.PERPLEXITY_TIMEOUT,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"API Error: {response.status_code} - {response.text}")
+            
+            # Server-sent events: one "data: {json}" line per chunk
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                choices = _json_loads(data).get('choices')
+                piece = choices[0].get('delta', {}).get('content') if choices else None
+                if piece:
+                    pieces.append(piece)
+                    yield piece
+        
+        # Only complete answers are cached; an abandoned stream never gets here
+        if cache_path:
+            self._write_cache(cache_path, "".join(pieces))
+    
+    def _cache_path(self, body: bytes) -> str:
+        """Cache file for a request body (canonical JSON), or None when caching is off"""
+        if not self.cache_dir:
+            return None
+        key = hashlib.sha256(body).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    def _read_cache(self, path: str) -> str:
+        """Cached response content, or None on a miss or unreadable entry"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)['content']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+    
+    def _write_cache(self, path: str, content: str):
+        """Store response content; written to a temp file and renamed into
+        place so concurrent readers never see a partial entry"""
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'content': content}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
     
     def suggest_next_steps(self, analysis_result: str) -> List[str]:
         """Suggest follow-up questions or actions based on analysis"""
         
         suggestions = []
+        result_lower = analysis_result.lower()
         
-        if 'error' in analysis_result.lower():
+        if 'error' in result_lower:
             suggestions.append("Get more details about the specific error")
             suggestions.append("Check if other users are affected by the same issue")
         
-        if 'api' in analysis_result.lower():
+        if 'api' in result_lower:
             suggestions.append("Analyze the complete API call chain")
             suggestions.append("Check API response times and performance")
         
-        if 'user' in analysis_result.lower():
+        if 'user' in result_lower:
             suggestions.append("View the complete user journey")
             suggestions.append("Compare with other users' behavior")
         